@@ -0,0 +1,215 @@
+import sys
+import json
+import time
+import platform
+import multiprocessing
+# the peak resident memory of the measuring process, not available on Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+from datetime import datetime, timezone
+import numpy as np
+# importing Qiskit
+import qiskit
+from qiskit import Aer, QuantumCircuit, transpile
+# import the algorithms to benchmark
+from QuantumFourierTransform import QFourier, QFourier_inverse, QFourier_init
+from QuantumPhaseEstimation import QuantumPhaseEstimation
+from PeriodFindingAndShor import c_amod15, qpe_amod15_circuit
+from Grover import Grover_circuit, Grover_oracle, Grover_diffuser
+from Simon import Simon_oracle
+from DeutschJozsa import dj_oracle, dj_algorithm
+# import the name of a backend
+from Instrumentation import backend_metadata
+
+
+# the file collecting the benchmark records, one JSON record per line
+BENCHMARK_HISTORY = 'benchmark_history.jsonl'
+
+
+# wrap a gate returned by a builder into a circuit on its own qubits
+def as_circuit(circuit):
+    if isinstance(circuit, QuantumCircuit):
+        return circuit
+    qc = QuantumCircuit(circuit.num_qubits)
+    qc.append(circuit, range(circuit.num_qubits))
+    return qc
+
+
+# the QFT of the state |j> on n qubits
+def build_QFourier(n):
+    qc = QFourier_init(n, 2**n-1)
+    QFourier(qc, n)
+    return qc
+
+
+# the QFT followed by the inverse QFT on n qubits
+def build_QFourier_inverse(n):
+    qc = build_QFourier(n)
+    QFourier_inverse(qc, n)
+    return qc
+
+
+# the phase estimation circuit with t counting qubits for theta = 1/3
+def build_QuantumPhaseEstimation(t):
+    qc = QuantumCircuit(t+1, t)
+    qc.x(t)
+    qc.barrier()
+    QuantumPhaseEstimation(qc, t, 1/3)
+    return qc
+
+
+# the controlled multiplication by a = 7 mod 15, repeated 2**(n-1) times
+def build_c_amod15(n):
+    return as_circuit(c_amod15(7, 2**(n-1)))
+
+
+# the period finding circuit for a = 7 with n counting qubits
+def build_qpe_amod15(n):
+    return qpe_amod15_circuit(7, n)
+
+
+# Grover's circuit on n qubits searching for the string 10...10
+def build_Grover_circuit(n):
+    b = ('10'*n)[:n]
+    t = max(1, int(np.pi/4*np.sqrt(n)))
+    return Grover_circuit(n, Grover_oracle(b), Grover_diffuser(n), t)
+
+
+# the Simon oracle for the implemented secret strings, n is the length of b
+def build_Simon_oracle(n):
+    return Simon_oracle({2: '11', 3: '101'}[n])
+
+
+# the Deutsch-Jozsa circuit with a balanced oracle on n qubits
+def build_dj_algorithm(n):
+    np.random.seed(n)
+    return dj_algorithm(dj_oracle('balanced', n), n)
+
+
+# the benchmarked builders and the problem sizes n to sweep over
+BENCHMARK_CASES = {
+    'QFourier': (build_QFourier, [2, 4, 6, 8, 10, 12]),
+    'QFourier_inverse': (build_QFourier_inverse, [2, 4, 6, 8, 10, 12]),
+    'QuantumPhaseEstimation': (build_QuantumPhaseEstimation, [2, 3, 4, 5, 6, 7]),
+    'c_amod15': (build_c_amod15, [1, 2, 4, 8]),
+    'qpe_amod15': (build_qpe_amod15, [3, 4, 6, 8]),
+    'Grover_circuit': (build_Grover_circuit, [2, 4, 6, 8, 10, 12]),
+    'Simon_oracle': (build_Simon_oracle, [2, 3]),
+    'dj_algorithm': (build_dj_algorithm, [2, 4, 6, 8, 10, 12]),
+}
+
+
+# the maximum resident memory of this process so far in bytes
+# on Linux ru_maxrss carries over the peak of the parent through fork and exec, so read the
+# peak of this process from /proc
+def _max_rss():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])*1024
+    except OSError:
+        pass
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss*1024
+
+
+# build, transpile and simulate the case name of BENCHMARK_CASES, run in a fresh process
+# returns the resident memory before the case (the interpreter and the imports) and the peak
+def _case_memory(name, n, backend_name, shots):
+    base_memory = _max_rss()
+    backend = Aer.get_backend(backend_name)
+    circuit = as_circuit(BENCHMARK_CASES[name][0](n))
+    if circuit.num_clbits == 0:
+        circuit.measure_all()
+    backend.run(transpile(circuit, backend), shots=shots, seed_simulator=n).result()
+    return base_memory, _max_rss()
+
+
+# the resident memory of a fresh process before and at the peak of running one case,
+# including the native statevector of the simulator, or (None, None) without resource
+def measure_memory(name, n, backend_name, shots):
+    if resource is None:
+        return None, None
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(_case_memory, (name, n, backend_name, shots))
+
+
+# benchmark one builder at problem size n on the given backend
+# returns the construction, transpile and simulation times in seconds,
+# the transpiled depth and gate counts, and with memory=True the resident memory in bytes
+# of a separate process running the case, so the timings are taken untraced
+def benchmark_case(name, build, n, backend, shots, memory=True):
+    start = time.perf_counter()
+    circuit = as_circuit(build(n))
+    construction_time = time.perf_counter() - start
+    # simulate measurement of all qubits if the builder does not measure
+    if circuit.num_clbits == 0:
+        circuit.measure_all()
+    start = time.perf_counter()
+    transpiled_circuit = transpile(circuit, backend)
+    transpile_time = time.perf_counter() - start
+    start = time.perf_counter()
+    backend.run(transpiled_circuit, shots=shots, seed_simulator=n).result()
+    simulation_time = time.perf_counter() - start
+    base_memory = peak_memory = None
+    if memory:
+        base_memory, peak_memory = measure_memory(name, n, backend_metadata(backend)['backend'], shots)
+
+    return {
+        'case': name,
+        'n': n,
+        'num_qubits': circuit.num_qubits,
+        'shots': shots,
+        'construction_time': construction_time,
+        'transpile_time': transpile_time,
+        'simulation_time': simulation_time,
+        'depth': transpiled_circuit.depth(),
+        'size': transpiled_circuit.size(),
+        'gate_counts': dict(sorted(transpiled_circuit.count_ops().items())),
+        'base_memory': base_memory,
+        'peak_memory': peak_memory,
+    }
+
+
+# run the benchmark sweep over the chosen cases and append each record to history_file as
+# soon as it is taken, so a failing case keeps the records before it
+# cases=None runs every case in BENCHMARK_CASES, memory=False skips the memory measurement
+def run_benchmarks(cases=None, history_file=BENCHMARK_HISTORY, shots=1024, memory=True):
+    backend = Aer.get_backend('aer_simulator')
+    run_info = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'qiskit': qiskit.__version__,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+    }
+    records = []
+    for name in (cases or BENCHMARK_CASES):
+        build, sizes = BENCHMARK_CASES[name]
+        for n in sizes:
+            record = dict(run_info, **benchmark_case(name, build, n, backend, shots, memory))
+            records.append(record)
+            if history_file is not None:
+                with open(history_file, 'a') as f:
+                    f.write(json.dumps(record, sort_keys=True)+'\n')
+            print('{case:>24} n={n:<3} build {construction_time:.4f}s  transpile {transpile_time:.4f}s  '
+                  'simulate {simulation_time:.4f}s  depth {depth:<5} peak {peak_memory} B'.format(**record))
+    return records
+
+
+# load the benchmark history, optionally only the records of one case
+def load_benchmark_history(history_file=BENCHMARK_HISTORY, case=None):
+    with open(history_file) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if case is not None:
+        records = [record for record in records if record['case'] == case]
+    return records
+
+
+if __name__ == '__main__':
+    # cases = None runs all the benchmarks, otherwise give a list of names in BENCHMARK_CASES
+    cases = None
+    shots = 1024
+    run_benchmarks(cases, BENCHMARK_HISTORY, shots)
@@ -0,0 +1,221 @@
+import os
+import io
+import sys
+import json
+import hashlib
+import inspect
+import tempfile
+# importing Qiskit
+import qiskit
+from qiskit import QuantumCircuit, transpile
+try:
+    from qiskit import qpy
+except ImportError:
+    from qiskit.circuit import qpy_serialization as qpy
+# the lock serializing evictions, not available on Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+# import the opt-in stage instrumentation
+from Instrumentation import stage
+
+
+# A content-addressed disk cache of built and transpiled circuits in QPY format.
+# A circuit is stored under the hash of the builder (its name and the source of its
+# module), the builder arguments, the backend configuration, the transpile options
+# and the qiskit version, so it survives process restarts and is shared by all the
+# worker processes using the same cache directory. Files are written to a temporary
+# file and renamed into place, so readers never see a partial circuit, and the least
+# recently used files are evicted when the cache grows beyond max_bytes.
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.environ.get('QISKIT_CIRCUIT_CACHE', os.path.join(PROJECT_DIR, '.circuit_cache'))
+CACHE_MAX_BYTES = 512*2**20
+
+
+class CircuitCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key+'.qpy')
+
+    # the cached circuit under key, or None
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                circuit = qpy.load(f)[0]
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # written by an incompatible qiskit version, drop it
+            self._remove(path)
+            return None
+        # mark as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return circuit
+
+    # store circuit under key, then evict the least recently used circuits beyond max_bytes
+    def put(self, key, circuit):
+        buffer = io.BytesIO()
+        qpy.dump(circuit, buffer)
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                f.write(buffer.getvalue())
+            os.replace(temporary_path, self._path(key))
+        except BaseException:
+            self._remove(temporary_path)
+            raise
+        self.evict()
+
+    # remove the least recently used circuits until the cache holds at most max_bytes
+    def evict(self):
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.qpy'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.qpy'):
+                self._remove(entry.path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# the hashable description of a builder argument, circuits are described by their QPY bytes
+def _argument_key(argument):
+    if isinstance(argument, QuantumCircuit):
+        buffer = io.BytesIO()
+        qpy.dump(argument, buffer)
+        return hashlib.sha256(buffer.getvalue()).hexdigest()
+    if isinstance(argument, (list, tuple)):
+        return [_argument_key(item) for item in argument]
+    return repr(argument)
+
+
+def _backend_key(backend):
+    if backend is None:
+        return None
+    config = backend.configuration()
+    return [config.backend_name, config.backend_version, sorted(config.basis_gates),
+            config.coupling_map, config.n_qubits]
+
+
+_file_hashes = {}
+
+
+# the paths of the modules of this project used by module: module itself and the project
+# modules of the modules, functions and classes in its globals, recursively
+def _project_files(module):
+    files, stack = set(), [module]
+    while stack:
+        module = stack.pop()
+        path = getattr(module, '__file__', None)
+        if path is None:
+            continue
+        path = os.path.abspath(path)
+        if os.path.dirname(path) != PROJECT_DIR or path in files:
+            continue
+        files.add(path)
+        for value in vars(module).values():
+            if inspect.ismodule(value):
+                stack.append(value)
+            elif isinstance(getattr(value, '__module__', None), str) and value.__module__ in sys.modules:
+                stack.append(sys.modules[value.__module__])
+    return files
+
+
+def _file_hash(path):
+    if path not in _file_hashes:
+        with open(path, 'rb') as f:
+            _file_hashes[path] = hashlib.sha256(f.read()).hexdigest()
+    return _file_hashes[path]
+
+
+# the hash of the source of the module defining builder and of the project modules it uses
+# (e.g. QuantumFourierTransform for qpe_amod15_circuit), so edits invalidate the cache
+def _builder_key(builder):
+    files = sorted(_project_files(inspect.getmodule(builder)))
+    return [builder.__module__, builder.__qualname__,
+            [[os.path.basename(path), _file_hash(path)] for path in files]]
+
+
+# the cache key of builder(*args, **kwargs), transpiled for backend with transpile_options
+def cache_key(builder, args=(), kwargs=None, backend=None, transpile_options=None):
+    description = {
+        'builder': _builder_key(builder),
+        'args': _argument_key(list(args)),
+        'kwargs': {name: _argument_key(value) for name, value in sorted((kwargs or {}).items())},
+        'backend': _backend_key(backend),
+        'transpile_options': {name: repr(value) for name, value in sorted((transpile_options or {}).items())},
+        'qiskit': qiskit.__version__,
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+
+_default_cache = None
+
+
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = CircuitCache()
+    return _default_cache
+
+
+# the circuit builder(*args, **kwargs), loaded from the cache if it was built before
+def cached_build(builder, *args, cache=None, **kwargs):
+    cache = cache or default_cache()
+    key = cache_key(builder, args, kwargs)
+    with stage('build', cached=True) as s:
+        circuit = cache.get(key)
+        s.record(hit=circuit is not None)
+    if circuit is None:
+        with stage('build', cached=False):
+            circuit = builder(*args, **kwargs)
+        cache.put(key, circuit)
+    return circuit
+
+
+# the circuit builder(*args, **kwargs) transpiled for backend, loaded from the cache
+# if it was transpiled before
+def cached_transpile(builder, *args, backend=None, cache=None, transpile_options=None, **kwargs):
+    cache = cache or default_cache()
+    transpile_options = transpile_options or {}
+    key = cache_key(builder, args, kwargs, backend, transpile_options)
+    with stage('transpile', cached=True) as s:
+        transpiled_circuit = cache.get(key)
+        s.record(hit=transpiled_circuit is not None)
+    if transpiled_circuit is None:
+        circuit = cached_build(builder, *args, cache=cache, **kwargs)
+        with stage('transpile', cached=False):
+            transpiled_circuit = transpile(circuit, backend, **transpile_options)
+        cache.put(key, transpiled_circuit)
+    return transpiled_circuit
@@ -0,0 +1,191 @@
+import time
+import numpy as np
+from numpy import pi
+# importing Qiskit
+from qiskit import Aer, QuantumCircuit, transpile
+
+
+# The "performance compile" mode: the builders of this project put a barrier after
+# almost every layer to make the drawings readable, which stops the transpiler from
+# cancelling gates across layers. performance_compile() drops the barriers and runs a
+# peephole pass which cancels adjacent self-inverse gates (the H gates where the Grover
+# oracle meets the diffuser, a QFT followed by its inverse) and merges adjacent phase
+# gates on the same qubits (the repeated cp gates of phase estimation). Diagonal gates
+# commute, so the pass looks back past them when searching for a partner. The X layers
+# of the Grover oracle and diffuser are always separated by H layers, so they stay.
+
+# gates equal to their own inverse, and those whose qubits can be given in any order
+_SELF_INVERSE = ('h', 'x', 'y', 'z', 'cx', 'cy', 'cz', 'swap', 'ccx')
+_SYMMETRIC = ('cz', 'swap', 'cp', 'mcphase')
+# phase gates merged by adding their angles
+_PHASE = ('p', 'u1', 'rz', 'cp', 'mcphase')
+# gates diagonal in the computational basis, which commute with each other
+_DIAGONAL = ('z', 's', 'sdg', 't', 'tdg', 'p', 'u1', 'rz', 'cz', 'cp', 'crz', 'mcphase')
+
+
+# the circuit without barriers
+def strip_barriers(circuit):
+    stripped = _empty_like(circuit)
+    for operation, qargs, cargs in circuit.data:
+        if operation.name != 'barrier':
+            stripped.append(operation, qargs, cargs)
+    return stripped
+
+
+def _empty_like(circuit):
+    empty = QuantumCircuit(*circuit.qregs, *circuit.cregs, name=circuit.name)
+    empty.global_phase = circuit.global_phase
+    return empty
+
+
+def _qubit_key(name, qargs):
+    if name in _SYMMETRIC:
+        return frozenset(qargs)
+    if name == 'ccx':
+        return frozenset(qargs[:2]), qargs[2]
+    return tuple(qargs)
+
+
+def _angle(operation):
+    try:
+        return float(operation.params[0])
+    except (TypeError, ValueError):
+        return None
+
+
+# cancel adjacent self-inverse gates and merge adjacent phase gates, looking back at most
+# window instructions, repeated until nothing changes
+# returns the optimized data, whether anything changed and the global phase of removed gates
+def peephole(circuit, window=200):
+    data = list(circuit.data)
+    global_phase = 0
+    while True:
+        optimized, changed, phase = _peephole_pass(data, window)
+        data = optimized
+        global_phase += phase
+        if not changed:
+            break
+    optimized_circuit = _empty_like(circuit)
+    optimized_circuit.global_phase += global_phase
+    for operation, qargs, cargs in data:
+        optimized_circuit.append(operation, qargs, cargs)
+    return optimized_circuit
+
+
+def _peephole_pass(data, window):
+    output = []
+    changed = False
+    global_phase = 0
+    for operation, qargs, cargs in data:
+        name = operation.name
+        qubits, clbits = set(qargs), set(cargs)
+        movable = getattr(operation, 'condition', None) is None and not cargs
+        merged = False
+        if movable and (name in _SELF_INVERSE or name in _PHASE):
+            key = _qubit_key(name, qargs)
+            looked = 0
+            for index in range(len(output)-1, -1, -1):
+                if output[index] is None:
+                    continue
+                looked += 1
+                if looked > window:
+                    break
+                previous, previous_qargs, previous_cargs = output[index]
+                if qubits.isdisjoint(previous_qargs) and clbits.isdisjoint(previous_cargs):
+                    continue
+                if getattr(previous, 'condition', None) is None and previous.name == name \
+                        and _qubit_key(name, previous_qargs) == key:
+                    if name in _SELF_INVERSE:
+                        output[index] = None
+                        merged = True
+                    else:
+                        angle, previous_angle = _angle(operation), _angle(previous)
+                        if angle is not None and previous_angle is not None:
+                            total = angle+previous_angle
+                            if np.isclose(np.remainder(total+pi, 2*pi)-pi, 0):
+                                output[index] = None
+                                # rz(2 pi k) is (-1)^k times the identity
+                                if name == 'rz':
+                                    global_phase += total/2
+                            else:
+                                merged_operation = previous.copy()
+                                merged_operation.params = [total]
+                                output[index] = (merged_operation, previous_qargs, previous_cargs)
+                            merged = True
+                    break
+                # diagonal gates commute, keep looking past them
+                if name in _DIAGONAL and previous.name in _DIAGONAL \
+                        and getattr(previous, 'condition', None) is None:
+                    continue
+                break
+        if merged:
+            changed = True
+        else:
+            output.append((operation, qargs, cargs))
+    return [entry for entry in output if entry is not None], changed, global_phase
+
+
+# drop the barriers and cancel or merge the redundant gates of circuit
+def performance_compile(circuit):
+    return peephole(strip_barriers(circuit))
+
+
+# the gate counts, depth, transpile and simulation time of circuit as built and after
+# performance_compile(), both transpiled for and simulated on backend
+def compile_report(circuit, backend=None, shots=1024):
+    backend = backend or Aer.get_backend('aer_simulator')
+    report = {}
+    for mode in ('default', 'performance'):
+        start = time.perf_counter()
+        compiled_circuit = performance_compile(circuit) if mode == 'performance' else circuit
+        transpiled_circuit = transpile(compiled_circuit, backend)
+        transpile_time = time.perf_counter()-start
+        start = time.perf_counter()
+        if transpiled_circuit.num_clbits:
+            backend.run(transpiled_circuit, shots=shots).result()
+        else:
+            measured_circuit = transpiled_circuit.copy()
+            measured_circuit.save_statevector()
+            backend.run(measured_circuit).result()
+        simulation_time = time.perf_counter()-start
+        report[mode] = {
+            'size': transpiled_circuit.size(),
+            'depth': transpiled_circuit.depth(),
+            'gate_counts': dict(transpiled_circuit.count_ops()),
+            'transpile_time': transpile_time,
+            'simulation_time': simulation_time,
+        }
+    return report
+
+
+# print the savings of compile_report() for one circuit
+def print_compile_report(name, report):
+    default, performance = report['default'], report['performance']
+    print('{}: size {} -> {}, depth {} -> {}, transpile {:.4f}s -> {:.4f}s, simulate {:.4f}s -> {:.4f}s'.format(
+        name, default['size'], performance['size'], default['depth'], performance['depth'],
+        default['transpile_time'], performance['transpile_time'],
+        default['simulation_time'], performance['simulation_time']))
+
+
+if __name__ == '__main__':
+    from QuantumFourierTransform import QFourier, QFourier_init, QFourier_inverse
+    from QuantumPhaseEstimation import QuantumPhaseEstimation
+    from Grover import Grover_circuit, Grover_oracle, Grover_diffuser
+    # a QFT followed by its inverse as in QFourier_showcircuit
+    n = 8
+    qc = QFourier_init(n, 2**n-1)
+    QFourier(qc, n)
+    QFourier_inverse(qc, n)
+    print_compile_report('QFourier + QFourier_inverse', compile_report(qc))
+    # phase estimation with the repeated cp gates
+    t = 6
+    qc = QuantumCircuit(t+1, t)
+    qc.x(t)
+    QuantumPhaseEstimation(qc, t, 1/3)
+    print_compile_report('QuantumPhaseEstimation', compile_report(qc))
+    # Grover's circuit with several oracle and diffuser iterations
+    b = '1011010'
+    n = len(b)
+    qc = Grover_circuit(n, Grover_oracle(b), Grover_diffuser(n), 3)
+    qc.measure_all()
+    print_compile_report('Grover_circuit', compile_report(qc))
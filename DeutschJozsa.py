@@ -9,6 +9,10 @@ from qiskit import QuantumCircuit, assemble, transpile
 # import basic plot tools
 from qiskit.visualization import plot_histogram
 import matplotlib.pyplot as plt
+# import the opt-in stage instrumentation
+from Instrumentation import stage, instrumented
+# import the simulator dispatching small circuits to the NumPy statevector engine
+from StatevectorEngine import simulate
 
 # the demonstration of Deutsch-Jozsa Algorithm, including 
 #   (1) the constant oracle
@@ -118,6 +122,7 @@ def dj_oracle(case, n):
     return oracle_gate
 
 # run the Deutsch-Jozsa circuit
+@instrumented
 def dj_algorithm(oracle, n):
     dj_circuit = QuantumCircuit(n+1, n)
     # Set up the output qubit:
@@ -144,23 +149,20 @@ if __name__=='__main__':
     if demonstrate:
         dj_circuit = dj_demonstrate(n)
         # use local simulator
-        aer_sim = Aer.get_backend('aer_simulator')
         shots = 1024
-        qobj = assemble(dj_circuit, aer_sim)
-        results = aer_sim.run(qobj).result()
+        results = simulate(dj_circuit, shots=shots)
         answer = results.get_counts()
         plot_histogram(answer)
         plt.show()
     else:
-        oracle_gate = dj_oracle('balanced', n)
-        dj_circuit = dj_algorithm(oracle_gate, n)
+        with stage('build', n=n) as s:
+            oracle_gate = dj_oracle('balanced', n)
+            dj_circuit = dj_algorithm(oracle_gate, n)
+            s.record(circuit=dj_circuit)
         dj_circuit.draw(output='mpl')
         plt.show()
 
-        aer_sim = Aer.get_backend('aer_simulator')
-        transpiled_dj_circuit = transpile(dj_circuit, aer_sim)
-        qobj = assemble(transpiled_dj_circuit)
-        results = aer_sim.run(qobj).result()
+        results = simulate(dj_circuit)
         answer = results.get_counts()
         plot_histogram(answer)
         plt.show()
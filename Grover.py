@@ -6,11 +6,18 @@ from qiskit.providers.ibmq import least_busy
 # import basic plot tools
 import matplotlib.pyplot as plt
 from qiskit.visualization import plot_histogram
+# import the opt-in stage instrumentation
+from Instrumentation import stage, instrumented
+# import the simulator dispatching small circuits to the NumPy statevector engine
+from StatevectorEngine import simulate
+# import the integer array representation of counts
+from MeasurementCounts import result_counts, int_to_bitstring
 
 
 # construct a Grover's circuit on n qubits
 # given n-qubit oracle U_omega and the Grover's diffusion operator U_s
 # repeat U_sU_omega given number of times (t)
+@instrumented
 def Grover_circuit(n, oracle, diffuser, t):
     # initialization
     circuit = QuantumCircuit(n)
@@ -20,8 +27,8 @@ def Grover_circuit(n, oracle, diffuser, t):
     circuit.barrier()
     # repeat t times of U_sU_omega
     for iteration in range(t):
-        circuit += oracle
-        circuit += diffuser
+        circuit.compose(oracle, inplace=True)
+        circuit.compose(diffuser, inplace=True)
     # return Grover's circuit
     return circuit
 
@@ -133,30 +140,28 @@ if __name__=='__main__':
 
     c = np.pi/4
     t = int(c*np.sqrt(n))
-    Grover_circuit = Grover_circuit(n, oracle, diffuser, t)
+    with stage('build', n=n, t=t) as s:
+        Grover_circuit = Grover_circuit(n, oracle, diffuser, t)
+        s.record(circuit=Grover_circuit)
     Grover_circuit.draw(output='mpl')
     if show:
         plt.show()
 
     # simulate measurement
     Grover_circuit.measure_all()
-    aer_sim = Aer.get_backend('aer_simulator')
     shots = 5*(2**n)
-    qobj = assemble(Grover_circuit, shots=shots)
-    result = aer_sim.run(qobj).result()
-    counts = result.get_counts()
-    plot_histogram(counts)
+    result = simulate(Grover_circuit, shots=shots, optimize=True)
+    counts = result_counts(result)
     if show:
+        plot_histogram(counts.to_dict())
         plt.show()
     # find the maximal count string as the Grover guess result
     if guess:
-        maximal_count = 0
-        Grover_guess = ''
-        for key in counts.keys():
-            print(key, ':', counts[key])
-            if counts[key]>=maximal_count:
-                Grover_guess = key
-                maximal_count = counts[key]
+        for outcome, count in zip(counts.outcomes, counts.frequencies):
+            print(int_to_bitstring(outcome, n), ':', count)
+        with stage('postprocess'):
+            outcome, maximal_count = counts.most_frequent()
+            Grover_guess = int_to_bitstring(outcome, n)
         print('Grover guess is', Grover_guess, 'count is', maximal_count)
         if Grover_guess == b:
             print('Right Grover guess :)')
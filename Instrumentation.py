@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import time
+import uuid
+import functools
+import threading
+import contextvars
+
+
+# Opt-in instrumentation of the stages (build, transpile, simulate, postprocess)
+# of the algorithm entry points. Each finished stage is written as one JSON record
+# per line, which a local collector can tail. When disabled, stage() returns a
+# shared no-op context manager, so the hooks cost a function call and nothing else.
+# Set the environment variable QISKIT_INSTRUMENTATION to a file path (or '-' for
+# stdout) to enable it at import, or call enable_instrumentation().
+
+_sink = None
+_lock = threading.Lock()
+# the innermost running stage, per thread and per asyncio task
+_current_stage = contextvars.ContextVar('current_stage', default=None)
+
+
+# the stage returned while instrumentation is disabled, record() is a no-op
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def record(self, circuit=None, shots=None, backend=None, **fields):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+# a running stage, timed from __enter__ to __exit__ and written to the sink on exit
+class _Stage:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        parent = _current_stage.get()
+        self.run = parent.run if parent is not None else uuid.uuid4().hex
+        self.parent = parent.name if parent is not None else None
+        self._token = _current_stage.set(self)
+        self.start = time.time()
+        self.perf_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall_time = time.perf_counter() - self.perf_start
+        _current_stage.reset(self._token)
+        record = {
+            'run': self.run,
+            'stage': self.name,
+            'parent': self.parent,
+            'start': self.start,
+            'wall_time': wall_time,
+        }
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        record.update(self.fields)
+        _emit(record)
+        return False
+
+    # attach circuit metrics, the shot count, backend metadata or other fields to the record
+    def record(self, circuit=None, shots=None, backend=None, **fields):
+        if circuit is not None:
+            self.fields.update(circuit_metrics(circuit))
+        if shots is not None:
+            self.fields['shots'] = shots
+        if backend is not None:
+            self.fields.update(backend_metadata(backend))
+        self.fields.update(fields)
+
+
+def _emit(record):
+    line = json.dumps(record, default=str)+'\n'
+    with _lock:
+        if _sink is not None:
+            _sink.write(line)
+            _sink.flush()
+
+
+# the gate and depth counts of a circuit
+def circuit_metrics(circuit):
+    return {
+        'num_qubits': circuit.num_qubits,
+        'num_clbits': circuit.num_clbits,
+        'depth': circuit.depth(),
+        'size': circuit.size(),
+        'gate_counts': dict(circuit.count_ops()),
+    }
+
+
+# the name and version of a backend
+def backend_metadata(backend):
+    name = backend.name() if callable(backend.name) else backend.name
+    version = getattr(backend, 'backend_version', None)
+    if callable(version):
+        version = version()
+    return {'backend': name, 'backend_version': version}
+
+
+# start writing stage records to path (appending), '-' writes to stdout
+def enable_instrumentation(path='-'):
+    global _sink
+    disable_instrumentation()
+    with _lock:
+        _sink = sys.stdout if path == '-' else open(path, 'a')
+
+
+# stop writing stage records
+def disable_instrumentation():
+    global _sink
+    with _lock:
+        if _sink is not None and _sink is not sys.stdout:
+            _sink.close()
+        _sink = None
+
+
+def instrumentation_enabled():
+    return _sink is not None
+
+
+# context manager timing one stage of an algorithm, e.g.
+#   with stage('simulate', shots=shots) as s:
+#       result = backend.run(qc, shots=shots).result()
+#       s.record(circuit=qc, backend=backend)
+def stage(name, **fields):
+    if _sink is None:
+        return _NULL_STAGE
+    return _Stage(name, fields)
+
+
+# decorator timing every call of an entry point as a stage named after the function
+def instrumented(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _sink is None:
+            return function(*args, **kwargs)
+        with _Stage(function.__name__, {}):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+if os.environ.get('QISKIT_INSTRUMENTATION'):
+    enable_instrumentation(os.environ['QISKIT_INSTRUMENTATION'])
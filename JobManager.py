@@ -0,0 +1,134 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+# importing Qiskit
+from qiskit import Aer, QuantumCircuit, transpile
+# import the builders of the algorithms
+from QuantumPhaseEstimation import QuantumPhaseEstimation
+from Grover import Grover_circuit, Grover_oracle, Grover_diffuser
+from DeutschJozsa import dj_oracle, dj_algorithm
+# import the measured circuit of a builder result and the integer array counts
+from ParameterSweep import as_measured_circuit
+from MeasurementCounts import result_counts
+# import the opt-in stage instrumentation
+from Instrumentation import stage
+
+
+# An asyncio job manager pipelining the stages of many requests: while the simulator
+# runs the circuit of one request, the circuits of the next requests are built and
+# transpiled in a pool of worker processes, and the results of the previous ones are
+# post-processed. At most max_jobs simulator jobs run at once, and at most max_pending
+# requests are in flight, so submit() waits when a burst of requests exceeds them.
+#
+#     async with JobManager() as manager:
+#         counts = await asyncio.gather(*(manager.submit(qpe_amod15_circuit, a) for a in [2, 7, 8]))
+
+
+# builders of the measured circuits of the algorithm entry points from plain arguments,
+# so that they can be sent to the worker processes
+
+# the circuit of QuantumPhaseEstimation with t counting qubits for the phase theta
+def phase_estimation_circuit(t, theta, measured_iqft=False):
+    qc = QuantumCircuit(t+1, t)
+    qc.x(t)
+    qc.barrier()
+    return QuantumPhaseEstimation(qc, t, theta, measured_iqft)
+
+
+# Grover's circuit searching for the string b, with t iterations (by default pi/4 sqrt(n))
+def Grover_search_circuit(b, t=None):
+    n = len(b)
+    if t is None:
+        t = int(np.pi/4*np.sqrt(n))
+    circuit = Grover_circuit(n, Grover_oracle(b), Grover_diffuser(n), t)
+    circuit.measure_all()
+    return circuit
+
+
+# the Deutsch-Jozsa circuit for a random oracle of the given case on n qubits
+def dj_circuit(case, n, seed=None):
+    if seed is not None:
+        np.random.seed(seed)
+    return dj_algorithm(dj_oracle(case, n), n)
+
+
+# build and transpile one circuit, run in the worker processes
+def _build_and_transpile(builder, args, kwargs, backend_name):
+    circuit = as_measured_circuit(builder(*args, **kwargs))
+    return transpile(circuit, Aer.get_backend(backend_name))
+
+
+class JobManager:
+    def __init__(self, backend_name='aer_simulator', build_workers=None, max_jobs=2, max_pending=64):
+        self.backend_name = backend_name
+        self.backend = Aer.get_backend(backend_name)
+        self.build_workers = build_workers
+        self.max_jobs = max_jobs
+        self.max_pending = max_pending
+        self._builders = None
+        self._threads = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def start(self):
+        # forked workers can hang on the simulator threads of the parent, so spawn them
+        self._builders = ProcessPoolExecutor(self.build_workers, mp_context=multiprocessing.get_context('spawn'))
+        # waiting for simulator jobs and post-processing run in threads
+        self._threads = ThreadPoolExecutor(self.max_jobs+4)
+        self._job_slots = asyncio.Semaphore(self.max_jobs)
+        self._pending = asyncio.Semaphore(self.max_pending)
+
+    def close(self):
+        if self._builders is not None:
+            self._builders.shutdown()
+            self._threads.shutdown()
+            self._builders = self._threads = None
+
+    # build builder(*args, **kwargs), simulate it with shots and return postprocess(result),
+    # by default the counts as a CountsArray
+    async def submit(self, builder, *args, shots=1024, memory=False, seed=None, postprocess=result_counts,
+                     **kwargs):
+        loop = asyncio.get_running_loop()
+        async with self._pending:
+            with stage('request', builder=builder.__name__):
+                with stage('build') as s:
+                    transpiled_circuit = await loop.run_in_executor(
+                        self._builders, _build_and_transpile, builder, args, kwargs, self.backend_name)
+                    s.record(circuit=transpiled_circuit)
+                async with self._job_slots:
+                    with stage('simulate') as s:
+                        job = self.backend.run(transpiled_circuit, shots=shots, memory=memory, seed_simulator=seed)
+                        result = await loop.run_in_executor(self._threads, job.result)
+                        s.record(shots=shots, backend=self.backend)
+                with stage('postprocess'):
+                    return await loop.run_in_executor(self._threads, postprocess, result)
+
+    # submit builder for every argument tuple in argument_list, returns the results in order
+    async def map(self, builder, argument_list, **options):
+        return await asyncio.gather(*(self.submit(builder, *args, **options) for args in argument_list))
+
+
+# serve a burst of (builder, args) requests through a JobManager, returns the results in order
+def run_requests(requests, shots=1024, **manager_options):
+    async def serve():
+        async with JobManager(**manager_options) as manager:
+            return await asyncio.gather(*(manager.submit(builder, *args, shots=shots) for builder, args in requests))
+    return asyncio.run(serve())
+
+
+if __name__ == '__main__':
+    from PeriodFindingAndShor import qpe_amod15_circuit
+    requests = [(qpe_amod15_circuit, (a, 4)) for a in [2, 7, 8, 11, 13]] \
+        + [(dj_circuit, ('balanced', n, n)) for n in range(2, 8)] \
+        + [(Grover_search_circuit, (format(b, '05b'),)) for b in range(4)] \
+        + [(phase_estimation_circuit, (t, 1/3)) for t in range(2, 6)]
+    for (builder, args), counts in zip(requests, run_requests(requests)):
+        outcome, frequency = counts.most_frequent()
+        print(builder.__name__, args, 'most frequent outcome', format(outcome, '0{}b'.format(counts.num_bits)), frequency)
@@ -0,0 +1,147 @@
+import numpy as np
+
+
+# Measurement outcomes held as NumPy integer arrays instead of dicts keyed by bitstrings.
+# Registers of at most DENSE_MAX_BITS bits keep a dense bincount over all 2**num_bits
+# outcomes, larger registers keep the sorted unique outcomes and their frequencies.
+# The integer value of an outcome is int(bitstring, 2), with register separators removed.
+
+DENSE_MAX_BITS = 16
+
+
+class CountsArray:
+    def __init__(self, num_bits, outcomes, frequencies):
+        self.num_bits = num_bits
+        outcomes = np.asarray(outcomes, dtype=np.int64)
+        frequencies = np.asarray(frequencies, dtype=np.int64)
+        if num_bits <= DENSE_MAX_BITS:
+            self.dense = np.bincount(outcomes, weights=frequencies, minlength=2**num_bits).astype(np.int64)
+        else:
+            self.dense = None
+            order = np.argsort(outcomes)
+            self._outcomes = outcomes[order]
+            self._frequencies = frequencies[order]
+
+    # the counts of the outcomes in samples, an array of measured integer values
+    @classmethod
+    def from_samples(cls, samples, num_bits):
+        samples = np.asarray(samples, dtype=np.int64)
+        if num_bits <= DENSE_MAX_BITS:
+            return cls.from_dense(np.bincount(samples, minlength=2**num_bits), num_bits)
+        outcomes, frequencies = np.unique(samples, return_counts=True)
+        return cls(num_bits, outcomes, frequencies)
+
+    # the counts given by the frequencies of all 2**num_bits outcomes
+    @classmethod
+    def from_dense(cls, frequencies, num_bits):
+        if num_bits > DENSE_MAX_BITS:
+            frequencies = np.asarray(frequencies)
+            outcomes = np.flatnonzero(frequencies)
+            return cls(num_bits, outcomes, frequencies[outcomes])
+        counts = cls.__new__(cls)
+        counts.num_bits = num_bits
+        counts.dense = np.asarray(frequencies, dtype=np.int64)
+        return counts
+
+    # the counts of a get_counts() dict
+    @classmethod
+    def from_dict(cls, counts, num_bits=None):
+        keys = _strip_separators(list(counts))
+        if num_bits is None:
+            num_bits = len(keys[0]) if keys else 0
+        return cls(num_bits, bitstrings_to_int(keys, num_bits), list(counts.values()))
+
+    # the counts of a get_memory() list
+    @classmethod
+    def from_memory(cls, memory, num_bits=None):
+        memory = _strip_separators(memory)
+        if num_bits is None:
+            num_bits = len(memory[0]) if memory else 0
+        return cls.from_samples(bitstrings_to_int(memory, num_bits), num_bits)
+
+    # the observed outcomes in increasing order
+    @property
+    def outcomes(self):
+        if self.dense is not None:
+            return np.flatnonzero(self.dense)
+        return self._outcomes
+
+    # the frequencies of the observed outcomes
+    @property
+    def frequencies(self):
+        if self.dense is not None:
+            return self.dense[self.dense > 0]
+        return self._frequencies
+
+    @property
+    def shots(self):
+        return int(self.frequencies.sum())
+
+    # the phases outcome/2**num_bits of the observed outcomes
+    def phases(self):
+        return self.outcomes/2**self.num_bits
+
+    # the most frequent outcome and its frequency
+    def most_frequent(self):
+        if self.dense is not None:
+            outcome = int(np.argmax(self.dense))
+            return outcome, int(self.dense[outcome])
+        index = int(np.argmax(self._frequencies))
+        return int(self._outcomes[index]), int(self._frequencies[index])
+
+    # the frequency of outcome, given as an integer or a bitstring
+    def __getitem__(self, outcome):
+        if isinstance(outcome, str):
+            outcome = int(outcome.replace(' ', ''), 2)
+        if self.dense is not None:
+            return int(self.dense[outcome])
+        index = np.searchsorted(self._outcomes, outcome)
+        if index < len(self._outcomes) and self._outcomes[index] == outcome:
+            return int(self._frequencies[index])
+        return 0
+
+    def __len__(self):
+        return len(self.outcomes)
+
+    # the counts as a get_counts() style dict keyed by bitstrings
+    def to_dict(self):
+        return {int_to_bitstring(outcome, self.num_bits): int(frequency)
+                for outcome, frequency in zip(self.outcomes, self.frequencies)}
+
+    def __repr__(self):
+        return 'CountsArray(num_bits={}, shots={}, outcomes={})'.format(self.num_bits, self.shots, len(self))
+
+
+# parse equal length bitstrings into an integer array in one vectorized pass
+def bitstrings_to_int(bitstrings, num_bits):
+    if not bitstrings:
+        return np.zeros(0, dtype=np.int64)
+    bits = np.frombuffer(''.join(bitstrings).encode('ascii'), dtype=np.uint8).reshape(-1, num_bits) - ord('0')
+    weights = np.left_shift(1, np.arange(num_bits-1, -1, -1, dtype=np.int64))
+    return bits.astype(np.int64) @ weights
+
+
+# remove the spaces between registers from bitstrings
+def _strip_separators(bitstrings):
+    if bitstrings and ' ' in bitstrings[0]:
+        return [bitstring.replace(' ', '') for bitstring in bitstrings]
+    return bitstrings
+
+
+def int_to_bitstring(value, num_bits):
+    return format(int(value), '0{}b'.format(num_bits))
+
+
+# the counts of a simulation result as a CountsArray
+def result_counts(result):
+    if hasattr(result, 'get_counts_array'):
+        return result.get_counts_array()
+    return CountsArray.from_dict(result.get_counts())
+
+
+# the measured values of every shot of a simulation result (run with memory=True) as an integer array
+def result_memory(result):
+    if hasattr(result, 'get_memory_array'):
+        return result.get_memory_array()
+    memory = _strip_separators(result.get_memory())
+    return bitstrings_to_int(memory, len(memory[0]) if memory else 0)
@@ -0,0 +1,209 @@
+import os
+import json
+import hashlib
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+# importing Qiskit
+from qiskit import Aer, QuantumCircuit, transpile
+from qiskit.circuit import Gate, ControlledGate, Instruction
+# import the integer array counts
+from MeasurementCounts import CountsArray
+
+
+# Sweep any circuit builder of this project (Grover_oracle, QFourier_init, dj_oracle,
+# c_amod15, ...) over a grid of its arguments. Every point is built first, one after the
+# other in this process, and points building the same circuit are simulated once. The
+# distinct circuits are packed into batches, each batch is transpiled in one call in a
+# worker process, and the results are written to a NPZ part file in output as batches
+# finish. The batching is limited to the transpile: every circuit is run as its own Aer
+# job, since Aer derives the seeds of the experiments of one job from their position in
+# it, which would make the counts of a point depend on the batch it falls in.
+# Random builders are seeded from the seed of the sweep and the arguments of the point,
+# and circuits are simulated with a seed derived from the seed of the sweep and their
+# content, so every point gives the same circuit and counts on every run.
+
+
+# the grid {name: values} as a list of argument dicts, the last name varying fastest
+def grid_points(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def _seed(digest, seed):
+    return (int(digest[:8], 16)+seed) % 2**32
+
+
+# the seed building one point, derived from the sweep seed and the builder arguments
+def point_seed(builder, point, seed):
+    description = [builder.__module__, builder.__qualname__, {name: repr(value) for name, value in point.items()}]
+    return _seed(hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest(), seed)
+
+
+def _param_description(param):
+    if isinstance(param, np.ndarray):
+        return hashlib.sha256(np.ascontiguousarray(param).tobytes()).hexdigest()
+    return repr(param)
+
+
+# the instructions of circuit on the positions of their bits, with the definitions of
+# custom gates expanded; unlike QPY it ignores the generated names of circuits
+def _circuit_description(circuit):
+    positions = {bit: index for index, bit in enumerate(circuit.qubits+circuit.clbits)}
+    description = [circuit.num_qubits, circuit.num_clbits, repr(circuit.global_phase)]
+    for operation, qargs, cargs in circuit.data:
+        entry = [operation.name, [_param_description(param) for param in operation.params],
+                 [positions[bit] for bit in qargs], [positions[bit] for bit in cargs],
+                 repr(getattr(operation, 'condition', None))]
+        if type(operation) in (Gate, ControlledGate, Instruction) and operation.definition is not None:
+            entry.append(_circuit_description(operation.definition))
+        description.append(entry)
+    return description
+
+
+# the hash of the content of circuit, equal for circuits built alike by different arguments
+def circuit_key(circuit):
+    return hashlib.sha256(json.dumps(_circuit_description(circuit)).encode()).hexdigest()
+
+
+# the circuit of a builder result, wrapping gates and measuring all qubits if nothing is measured
+def as_measured_circuit(circuit):
+    if not isinstance(circuit, QuantumCircuit):
+        gate = circuit
+        circuit = QuantumCircuit(gate.num_qubits)
+        circuit.append(gate, range(gate.num_qubits))
+    if circuit.num_clbits == 0:
+        circuit.measure_all()
+    return circuit
+
+
+# transpile one batch of circuits in a single transpile call, and simulate every circuit
+# with its own seed, so its counts do not depend on the batching (Aer does not take a seed
+# per experiment of a multi-experiment job)
+# returns one record per circuit with the circuit sizes and the counts
+def _run_batch(circuits, seeds, shots, backend_name):
+    backend = Aer.get_backend(backend_name)
+    transpiled_circuits = transpile(circuits, backend)
+    # submit all the jobs before waiting for the first one
+    jobs = [backend.run(circuit, shots=shots, seed_simulator=seed) for circuit, seed in zip(transpiled_circuits, seeds)]
+    records = []
+    for circuit, seed, job in zip(transpiled_circuits, seeds, jobs):
+        counts = CountsArray.from_dict(job.result().get_counts())
+        records.append({'seed': seed, 'valid': True, 'num_qubits': circuit.num_qubits,
+                        'num_clbits': circuit.num_clbits, 'depth': circuit.depth(), 'size': circuit.size(),
+                        'outcomes': counts.outcomes, 'frequencies': counts.frequencies})
+    return records
+
+
+# the record of a point whose builder returned None
+_INVALID_RECORD = {'seed': 0, 'valid': False, 'num_qubits': 0, 'num_clbits': 0, 'depth': 0, 'size': 0,
+                   'outcomes': np.zeros(0, dtype=np.int64), 'frequencies': np.zeros(0, dtype=np.int64)}
+
+
+# write the records of the given point indices as one NPZ part file of columns
+# the counts of point i are outcomes/frequencies[counts_offsets[i]:counts_offsets[i+1]]
+def _write_part(path, point_indices, points, build_seeds, records):
+    lengths = [len(record['outcomes']) for record in records]
+    np.savez(path,
+             point=np.array(point_indices, dtype=np.int64),
+             params=np.array([json.dumps(point, sort_keys=True) for point in points]),
+             build_seed=np.array(build_seeds, dtype=np.int64),
+             seed=np.array([record['seed'] for record in records], dtype=np.int64),
+             valid=np.array([record['valid'] for record in records]),
+             num_qubits=np.array([record['num_qubits'] for record in records], dtype=np.int64),
+             num_clbits=np.array([record['num_clbits'] for record in records], dtype=np.int64),
+             depth=np.array([record['depth'] for record in records], dtype=np.int64),
+             size=np.array([record['size'] for record in records], dtype=np.int64),
+             counts_offsets=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+             outcomes=np.concatenate([record['outcomes'] for record in records]).astype(np.int64),
+             frequencies=np.concatenate([record['frequencies'] for record in records]).astype(np.int64))
+
+
+# sweep builder over the grid {argument name: values}, writing part-*.npz files to output
+# processes=1 runs the batches in this process, otherwise in a pool of that many workers
+# (None uses one per CPU); returns the number of points
+def sweep(builder, grid, output, shots=1024, seed=0, processes=None, batch_size=16,
+          backend_name='aer_simulator'):
+    points = grid_points(grid)
+    build_seeds = [point_seed(builder, point, seed) for point in points]
+    # build every point and group the points building the same circuit
+    circuits, copies, invalid = {}, {}, []
+    for index, (point, build_seed) in enumerate(zip(points, build_seeds)):
+        np.random.seed(build_seed)
+        circuit = builder(**point)
+        if circuit is None:
+            invalid.append(index)
+            continue
+        circuit = as_measured_circuit(circuit)
+        key = circuit_key(circuit)
+        circuits.setdefault(key, circuit)
+        copies.setdefault(key, []).append(index)
+    keys = list(circuits)
+    batches = [keys[start:start+batch_size] for start in range(0, len(keys), batch_size)]
+
+    os.makedirs(output, exist_ok=True)
+
+    def write(number, point_indices, records):
+        _write_part(os.path.join(output, 'part-{:05d}.npz'.format(number)), point_indices,
+                    [points[index] for index in point_indices], [build_seeds[index] for index in point_indices], records)
+
+    def write_batch(number, batch, records):
+        point_indices, batch_records = [], []
+        for key, record in zip(batch, records):
+            point_indices.extend(copies[key])
+            batch_records.extend([record]*len(copies[key]))
+        write(number, point_indices, batch_records)
+
+    # the points without a circuit go to the part after the batches
+    if invalid:
+        write(len(batches), invalid, [_INVALID_RECORD]*len(invalid))
+    arguments = [([circuits[key] for key in batch], [_seed(key, seed) for key in batch], shots, backend_name)
+                 for batch in batches]
+    if processes == 1:
+        for number, batch in enumerate(batches):
+            write_batch(number, batch, _run_batch(*arguments[number]))
+    else:
+        # forked workers can hang on the simulator threads of the parent, so spawn them
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = {executor.submit(_run_batch, *arguments[number]): number for number in range(len(batches))}
+            for future in as_completed(futures):
+                number = futures[future]
+                write_batch(number, batches[number], future.result())
+    return len(points)
+
+
+# load the part files of a sweep as one dict of columns ordered by point
+# counts is the list of CountsArray of every point
+def load_sweep(output):
+    parts = [np.load(os.path.join(output, name)) for name in sorted(os.listdir(output))
+             if name.startswith('part-') and name.endswith('.npz')]
+    columns, counts = {}, []
+    for part in parts:
+        offsets = part['counts_offsets']
+        for name in ('point', 'params', 'build_seed', 'seed', 'valid', 'num_qubits', 'num_clbits', 'depth', 'size'):
+            columns.setdefault(name, []).append(part[name])
+        for i, num_clbits in enumerate(part['num_clbits']):
+            outcomes = part['outcomes'][offsets[i]:offsets[i+1]]
+            frequencies = part['frequencies'][offsets[i]:offsets[i+1]]
+            counts.append(CountsArray(int(num_clbits), outcomes, frequencies))
+    columns = {name: np.concatenate(values) for name, values in columns.items()}
+    order = np.argsort(columns['point']) if columns else []
+    columns = {name: values[order] for name, values in columns.items()}
+    columns['counts'] = [counts[i] for i in order]
+    return columns
+
+
+if __name__ == '__main__':
+    from Grover import Grover_oracle
+    from PeriodFindingAndShor import c_amod15
+    from DeutschJozsa import dj_oracle
+    # Grover oracles over all strings b of 4 bits
+    n = sweep(Grover_oracle, {'b': [format(b, '04b') for b in range(16)]}, 'sweep_Grover_oracle')
+    print(n, 'points written to sweep_Grover_oracle')
+    # controlled multiplication by every allowed a mod 15
+    n = sweep(c_amod15, {'a': [2, 7, 8, 11, 13], 'power': [1, 2, 4]}, 'sweep_c_amod15')
+    print(n, 'points written to sweep_c_amod15')
+    # balanced and constant Deutsch-Jozsa oracles over n
+    n = sweep(dj_oracle, {'case': ['balanced', 'constant'], 'n': [2, 4, 6, 8]}, 'sweep_dj_oracle')
+    print(n, 'points written to sweep_dj_oracle')
@@ -10,7 +10,15 @@ from qiskit import QuantumCircuit, ClassicalRegister, QuantumRegister
 import matplotlib.pyplot as plt
 from qiskit.visualization import plot_histogram
 # import inverse Quantum Fourier Transform
-from QuantumFourierTransform import QFourier_inverse
+from QuantumFourierTransform import QFourier_inverse, QFourier_inverse_measured
+# import the opt-in stage instrumentation
+from Instrumentation import stage, instrumented
+# import the simulator dispatching small circuits to the NumPy statevector engine
+from StatevectorEngine import simulate, engine_supports
+# import the integer array representation of counts
+from MeasurementCounts import result_counts, result_memory, int_to_bitstring
+# import the disk cache of built and transpiled circuits
+from CircuitCache import cached_build, cached_transpile
 
 
 # U |y> = |ay mod 15>
@@ -42,57 +50,56 @@ def c_amod15(a, power):
 
 
 # Demonstrate the period-finding algorithm
+@instrumented
 def periodfinding_demonstration():
     # Specify variables
     n_count = 3  # number of counting qubits
     a = 7
-    # Create QuantumCircuit with n_count counting qubits
-    # plus 4 qubits for U to act on
-    qc = QuantumCircuit(n_count + 4, n_count)
-    # Initialize counting qubits
-    # in state |+>
-    for q in range(n_count):
-        qc.h(q)
-    qc.barrier()
-    # And auxiliary register in state |1>
-    qc.x(3 + n_count)
-    qc.barrier()
-    # Do controlled-U operations
-    for q in range(n_count):
-        qc.append(c_amod15(a, 2**q), [q] + [i+n_count for i in range(4)])
-    qc.barrier()
-    # Do inverse-QFT
-    QFourier_inverse(qc, n_count)
-    # Measure circuit
-    qc.measure(range(n_count), range(n_count))
+    with stage('build') as s:
+        # Create QuantumCircuit with n_count counting qubits
+        # plus 4 qubits for U to act on
+        qc = QuantumCircuit(n_count + 4, n_count)
+        # Initialize counting qubits
+        # in state |+>
+        for q in range(n_count):
+            qc.h(q)
+        qc.barrier()
+        # And auxiliary register in state |1>
+        qc.x(3 + n_count)
+        qc.barrier()
+        # Do controlled-U operations
+        for q in range(n_count):
+            qc.append(c_amod15(a, 2**q), [q] + [i+n_count for i in range(4)])
+        qc.barrier()
+        # Do inverse-QFT
+        QFourier_inverse(qc, n_count)
+        # Measure circuit
+        qc.measure(range(n_count), range(n_count))
+        s.record(circuit=qc)
     qc.draw(fold=-1, output='mpl')  # -1 means 'do not fold' 
     plt.show()
     # simulate result
-    aer_sim = Aer.get_backend('aer_simulator')
-    t_qc = transpile(qc, aer_sim)
-    qobj = assemble(t_qc)
-    results = aer_sim.run(qobj).result()
-    counts = results.get_counts()
-    plot_histogram(counts)
+    results = simulate(qc)
+    counts = result_counts(results)
+    plot_histogram(counts.to_dict())
     plt.show()
-    # calculate the phases
-    rows, measured_phases = [], []
-    for output in counts:
-        decimal = int(output, 2)  # Convert (base 2) string to decimal
-        phase = decimal/(2**n_count)  # Find corresponding eigenvalue
-        measured_phases.append(phase)
+    with stage('postprocess'):
+        # calculate the phases, the outcomes are already decimal
+        measured_phases = counts.phases()  # Find corresponding eigenvalues
         # Add these values to the rows in our table:
-        rows.append([f"{output}(bin) = {decimal:>3}(dec)", 
-                    f"{decimal}/{2**n_count} = {phase:.2f}"])
+        rows = [[f"{int_to_bitstring(decimal, n_count)}(bin) = {decimal:>3}(dec)",
+                 f"{decimal}/{2**n_count} = {phase:.2f}"]
+                for decimal, phase in zip(counts.outcomes, measured_phases)]
     # Print the rows in a table
     headers=["Register Output", "Phase"]
     df = pd.DataFrame(rows, columns=headers)
     print(df)
     # phases and guesses for r
-    rows = []
-    for phase in measured_phases:
-        frac = Fraction(phase).limit_denominator(15)
-        rows.append([phase, f"{frac.numerator}/{frac.denominator}", frac.denominator])
+    with stage('postprocess'):
+        rows = []
+        for phase in measured_phases:
+            frac = Fraction(phase).limit_denominator(15)
+            rows.append([phase, f"{frac.numerator}/{frac.denominator}", frac.denominator])
     # Print as a table
     headers=["Phase", "Fraction", "Guess for r"]
     df = pd.DataFrame(rows, columns=headers)
@@ -101,6 +108,7 @@ def periodfinding_demonstration():
 
 
 # Demonstrate an example of Shor's factorization algorithm
+@instrumented
 def Shor_demonstration():
     # factoring N
     N = 15
@@ -112,13 +120,14 @@ def Shor_demonstration():
     gcd(a, N)
     # find the phase s/r for a mod 15
     phase = qpe_amod15(a) # Phase = s/r
-    # estimate the period r
-    Fraction(phase).limit_denominator(15) # Denominator should (hopefully!) tell us r
-    frac = Fraction(phase).limit_denominator(15)
-    s, r = frac.numerator, frac.denominator
+    with stage('postprocess'):
+        # estimate the period r
+        Fraction(phase).limit_denominator(15) # Denominator should (hopefully!) tell us r
+        frac = Fraction(phase).limit_denominator(15)
+        s, r = frac.numerator, frac.denominator
+        # factor
+        guesses = [gcd(a**(r//2)-1, N), gcd(a**(r//2)+1, N)]
     print(r)
-    # factor
-    guesses = [gcd(a**(r//2)-1, N), gcd(a**(r//2)+1, N)]
     print(guesses)
     # repeat until totally factored
     a = 7
@@ -128,40 +137,58 @@ def Shor_demonstration():
         attempt += 1
         print("\nAttempt %i:" % attempt)
         phase = qpe_amod15(a) # Phase = s/r
-        frac = Fraction(phase).limit_denominator(N) # Denominator should (hopefully!) tell us r
-        r = frac.denominator
-        print("Result: r = %i" % r)
-        if phase != 0:
-            # Guesses for factors are gcd(x^{r/2} ±1 , 15)
-            guesses = [gcd(a**(r//2)-1, N), gcd(a**(r//2)+1, N)]
-            print("Guessed Factors: %i and %i" % (guesses[0], guesses[1]))
-            for guess in guesses:
-                if guess not in [1,N] and (N % guess) == 0: # Check to see if guess is a factor
-                    print("*** Non-trivial factor found: %i ***" % guess)
-                    factor_found = True
+        with stage('postprocess', attempt=attempt):
+            frac = Fraction(phase).limit_denominator(N) # Denominator should (hopefully!) tell us r
+            r = frac.denominator
+            print("Result: r = %i" % r)
+            if phase != 0:
+                # Guesses for factors are gcd(x^{r/2} ±1 , 15)
+                guesses = [gcd(a**(r//2)-1, N), gcd(a**(r//2)+1, N)]
+                print("Guessed Factors: %i and %i" % (guesses[0], guesses[1]))
+                for guess in guesses:
+                    if guess not in [1,N] and (N % guess) == 0: # Check to see if guess is a factor
+                        print("*** Non-trivial factor found: %i ***" % guess)
+                        factor_found = True
     return None
 
 
-# periodic finding for N = 15
-def qpe_amod15(a):
-    n_count = 8
+# the period finding circuit for N = 15 with n_count counting qubits
+# measured_iqft=True uses the semi-classical inverse Fourier transform
+@instrumented
+def qpe_amod15_circuit(a, n_count=8, measured_iqft=False):
     qc = QuantumCircuit(4+n_count, n_count)
     for q in range(n_count):
         qc.h(q)     # Initialize counting qubits in state |+>
     qc.x(3+n_count) # And auxiliary register in state |1>
     for q in range(n_count): # Do controlled-U operations
         qc.append(c_amod15(a, 2**q), [q] + [i+n_count for i in range(4)])
-    QFourier_inverse(qc, n_count)
-    qc.measure(range(n_count), range(n_count))
+    if measured_iqft:
+        QFourier_inverse_measured(qc, n_count)
+    else:
+        QFourier_inverse(qc, n_count)
+        qc.measure(range(n_count), range(n_count))
+    return qc
+
+
+# periodic finding for N = 15
+@instrumented
+def qpe_amod15(a, measured_iqft=False):
+    n_count = 8
+    # the circuit is loaded from the disk cache after the first run, the NumPy engine
+    # runs it as built, only Aer needs the cached transpiled circuit
+    qc = cached_build(qpe_amod15_circuit, a, n_count, measured_iqft)
     # Simulate Results
-    aer_sim = Aer.get_backend('aer_simulator')
     # Setting memory=True below allows us to see a list of each sequential reading
-    t_qc = transpile(qc, aer_sim)
-    qobj = assemble(t_qc, shots=1)
-    result = aer_sim.run(qobj, memory=True).result()
-    readings = result.get_memory()
-    print("Register Reading: " + readings[0])
-    phase = int(readings[0],2)/(2**n_count)
+    if engine_supports(qc):
+        result = simulate(qc, shots=1, memory=True)
+    else:
+        aer_sim = Aer.get_backend('aer_simulator')
+        qc = cached_transpile(qpe_amod15_circuit, a, n_count, measured_iqft, backend=aer_sim)
+        result = simulate(qc, shots=1, memory=True, backend=aer_sim, transpiled=True)
+    readings = result_memory(result)
+    print("Register Reading: " + int_to_bitstring(readings[0], n_count))
+    with stage('postprocess'):
+        phase = int(readings[0])/(2**n_count)
     print("Corresponding Phase: %f" % phase)
     return phase
 
@@ -1,11 +1,9 @@
 import numpy as np
-from qiskit import QuantumCircuit, transpile
-from qiskit.providers.aer import QasmSimulator
+from qiskit import QuantumCircuit
 from qiskit.visualization import plot_histogram
 import matplotlib.pyplot as plt
-
-# Use Aer's qasm_simulator
-simulator = QasmSimulator()
+# import the simulator dispatching small circuits to the NumPy statevector engine
+from StatevectorEngine import simulate
 
 # Create a Quantum Circuit acting on the q register
 circuit = QuantumCircuit(2, 2)
@@ -19,15 +17,10 @@ circuit.cx(0, 1)
 # Map the quantum measurement to the classical bits
 circuit.measure([0,1], [0,1])
 
-# compile the circuit down to low-level QASM instructions
-# supported by the backend (not needed for simple circuits)
-compiled_circuit = transpile(circuit, simulator)
-
-# Execute the circuit on the qasm simulator
-job = simulator.run(compiled_circuit, shots=1000)
-
-# Grab results from the job
-result = job.result()
+# Execute the circuit: small circuits like this one run on the built-in NumPy
+# statevector engine, larger ones are compiled down to low-level instructions
+# and executed on Aer's simulator
+result = simulate(circuit, shots=1000)
 
 # Returns counts
 counts = result.get_counts(circuit)
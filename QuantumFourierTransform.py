@@ -5,8 +5,12 @@ from qiskit import QuantumCircuit, transpile, assemble, Aer, IBMQ
 from qiskit.providers.ibmq import least_busy
 from qiskit.tools.monitor import job_monitor
 # import basic plot tools
-from qiskit.visualization import plot_histogram, plot_bloch_multivector
+from qiskit.visualization import plot_histogram, plot_bloch_vector
 import matplotlib.pyplot as plt
+# import the opt-in stage instrumentation
+from Instrumentation import stage, instrumented
+# import the statevector simulation, on the NumPy engine for small circuits
+from StatevectorEngine import simulate_statevector
 
 
 # demonstrate a simple 4 qubit Quantum Fourier Transform (QFourierT) circuit
@@ -115,10 +119,100 @@ def QFourier_inverse(circuit, n):
     return circuit
 
 
+# semi-classical inverse Quantum Fourier Transform on the first n qubits of circuit,
+# followed by their measurement into the first n classical bits
+# as the register is measured right away, each controlled phase is replaced by a phase
+# on the target conditioned on the already measured control bit, and the swaps by
+# relabelling the qubits, so no two-qubit gates are left
+# the NumPy statevector engine runs the conditioned phases as controlled phases (deferred
+# measurement), as fast as QFourier_inverse; Aer runs circuits with c_if one shot at a
+# time, which is far slower for many shots (0.02s -> 2s for phase estimation with t = 8
+# and 2048 shots), and where the controlled-U gates dominate, as in qpe_amod15, the
+# transpiled depth barely changes
+def QFourier_inverse_measured(circuit, n):
+    for target in range(n):
+        qubit = n-target-1
+        for control in range(target):
+            circuit.p(-pi/2**(target-control), qubit).c_if(circuit.clbits[control], 1)
+        circuit.h(qubit)
+        circuit.measure(qubit, target)
+    return circuit
+
+
+# the reduced density matrix element rho_01 = sum a_0 conj(a_1) and the weight sum |a_0|^2-|a_1|^2
+# of every qubit k < log2(len(amplitudes)) within one block of amplitudes
+def _block_bloch_sums(amplitudes, n):
+    rho_01 = np.zeros(n, dtype=complex)
+    weight = np.zeros(n)
+    probabilities = np.abs(amplitudes)**2
+    for qubit in range(n):
+        # split the amplitudes by the bit of qubit, the axes are the higher bits, the bit, the lower bits
+        pairs = amplitudes.reshape(-1, 2, 2**qubit)
+        rho_01[qubit] = np.vdot(pairs[:, 1, :], pairs[:, 0, :])
+        split = probabilities.reshape(-1, 2, 2**qubit)
+        weight[qubit] = split[:, 0, :].sum()-split[:, 1, :].sum()
+    return rho_01, weight
+
+
+# the Bloch vectors of all n qubits of a statevector as a 3 x n array of the x, y, z coordinates
+# statevector is an array, a Statevector, or the path of a .npy file or of a raw complex128 file,
+# which is memory-mapped; with chunk_size (a power of 2) the amplitudes are read in blocks of
+# chunk_size, so only a few blocks need to be in memory at once
+def bloch_vectors(statevector, chunk_size=None):
+    if isinstance(statevector, str):
+        if statevector.endswith('.npy'):
+            statevector = np.load(statevector, mmap_mode='r')
+        else:
+            statevector = np.memmap(statevector, dtype=np.complex128, mode='r')
+    amplitudes = np.asarray(statevector).reshape(-1)
+    n = int(np.log2(len(amplitudes)))
+    if len(amplitudes) != 2**n:
+        raise ValueError('The statevector length {} is not a power of 2'.format(len(amplitudes)))
+    if chunk_size is not None and (chunk_size < 1 or chunk_size & (chunk_size-1)):
+        raise ValueError('chunk_size must be a power of 2, got {}'.format(chunk_size))
+    if chunk_size is None or chunk_size >= len(amplitudes):
+        rho_01, weight = _block_bloch_sums(amplitudes, n)
+        norm = np.vdot(amplitudes, amplitudes).real
+    else:
+        # qubits below m pair amplitudes within a block, qubits from m on pair whole blocks
+        m = int(np.log2(chunk_size))
+        rho_01 = np.zeros(n, dtype=complex)
+        weight = np.zeros(n)
+        norm = 0
+        for block in range(len(amplitudes)//chunk_size):
+            chunk = np.asarray(amplitudes[block*chunk_size:(block+1)*chunk_size])
+            block_rho_01, block_weight = _block_bloch_sums(chunk, m)
+            rho_01[:m] += block_rho_01
+            weight[:m] += block_weight
+            block_norm = np.vdot(chunk, chunk).real
+            norm += block_norm
+            for qubit in range(m, n):
+                bit = 1 << (qubit-m)
+                if block & bit:
+                    weight[qubit] -= block_norm
+                else:
+                    weight[qubit] += block_norm
+                    partner = block+bit
+                    rho_01[qubit] += np.vdot(amplitudes[partner*chunk_size:(partner+1)*chunk_size], chunk)
+    return np.array([2*rho_01.real, -2*rho_01.imag, weight])/norm
+
+
+# plot the Bloch sphere of every qubit from the 3 x n Bloch vectors
+def plot_bloch_vectors(vectors, title=''):
+    n = vectors.shape[1]
+    figure = plt.figure(figsize=(5*n, 5))
+    for qubit in range(n):
+        ax = figure.add_subplot(1, n, qubit+1, projection='3d')
+        plot_bloch_vector(vectors[:, qubit], title='qubit '+str(qubit), ax=ax)
+    figure.suptitle(title)
+    return figure
+
+
 # show the circuit construction of Quantum Fourier Transform and the state vector change
 # also show inverse transform
 # if demonstrate = 1, show a demonstration of a 4 qubit circuit
 # n is number of registers, j is the initial state in [0, 2**n-1]
+@instrumented
 def QFourier_showcircuit(demonstrate, n, j):
     if demonstrate:
         # Encode the initial state
@@ -150,46 +244,52 @@ def QFourier_showcircuit(demonstrate, n, j):
 
         
     # start plotting the change of basis in Quantum Fourier Transform
-    sim = Aer.get_backend("aer_simulator")
     # the original basis
-    qc_init.save_statevector()
-    statevector = sim.run(qc_init).result().get_statevector()
-    plot_bloch_multivector(statevector)
+    with stage('simulate', basis='original') as s:
+        statevector = simulate_statevector(qc_init)
+        s.record(circuit=qc_init)
+    plot_bloch_vectors(bloch_vectors(statevector), 'original basis')
     plt.show()
     # the transformed basis
-    qc.save_statevector()
-    statevector = sim.run(qc).result().get_statevector()
-    plot_bloch_multivector(statevector)
+    with stage('simulate', basis='transformed') as s:
+        statevector = simulate_statevector(qc)
+        s.record(circuit=qc)
+    plot_bloch_vectors(bloch_vectors(statevector), 'transformed basis')
     #plt.savefig('D:\\Temporary Files\\Quantum Computing_2021_SummerSeminar\\qiskit_code\\QFourier_'+str(j))
     plt.show()
     # the inverse transformed basis
-    qc_inverse.save_statevector()
-    statevector = sim.run(qc_inverse).result().get_statevector()
-    plot_bloch_multivector(statevector)
+    with stage('simulate', basis='inverse') as s:
+        # the QFT and its inverse cancel in the performance compile mode
+        statevector = simulate_statevector(qc_inverse, optimize=True)
+        s.record(circuit=qc_inverse)
+    plot_bloch_vectors(bloch_vectors(statevector), 'inverse transformed basis')
     plt.show()
 
     return None
 
 
 # produce a sequence of figures showing the change of Fourier basis with n input qubits
+@instrumented
 def QFourier_produceanimation(animate, n):
 
     if not animate:
         return None
     
     for j in range(2**n-1):
-        # Encode the initial state
-        qc = QFourier_init(n, j)
-        # build the Quantum Fourier Transform circuit for demonstration
-        QFourier(qc, n)
+        with stage('build', n=n, j=j) as s:
+            # Encode the initial state
+            qc = QFourier_init(n, j)
+            # build the Quantum Fourier Transform circuit for demonstration
+            QFourier(qc, n)
+            s.record(circuit=qc)
 
         # start plotting the change of basis in Quantum Fourier Transform
-        sim = Aer.get_backend("aer_simulator")
         # the transformed basis
-        qc.save_statevector()
-        statevector = sim.run(qc).result().get_statevector()
-        plot_bloch_multivector(statevector)
-        plt.savefig('D:\\Temporary Files\\Quantum Computing_2021_SummerSeminar\\qiskit_code\\QFourier_'+str(j))
+        with stage('simulate', j=j):
+            statevector = simulate_statevector(qc)
+        figure = plot_bloch_vectors(bloch_vectors(statevector), 'j = '+str(j))
+        figure.savefig('D:\\Temporary Files\\Quantum Computing_2021_SummerSeminar\\qiskit_code\\QFourier_'+str(j))
+        plt.close(figure)
 
     return None
 
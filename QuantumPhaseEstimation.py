@@ -6,11 +6,17 @@ from qiskit import QuantumCircuit, ClassicalRegister, QuantumRegister
 from qiskit.visualization import plot_histogram
 import matplotlib.pyplot as plt
 # import inverse Quantum Fourier Transform
-from QuantumFourierTransform import QFourier_inverse
+from QuantumFourierTransform import QFourier_inverse, QFourier_inverse_measured
+# import the opt-in stage instrumentation
+from Instrumentation import stage, instrumented
+# import the simulator dispatching small circuits to the NumPy statevector engine
+from StatevectorEngine import simulate
 
 
 # the circuit for Quantum Phase Estimation
-def QuantumPhaseEstimation(qc, t, theta):
+# measured_iqft=True uses the semi-classical inverse Fourier transform
+@instrumented
+def QuantumPhaseEstimation(qc, t, theta, measured_iqft=False):
     # add H gates to qubit 0, 1, ..., t-1
     for qubit in range(t):
         qc.h(qubit)
@@ -23,10 +29,14 @@ def QuantumPhaseEstimation(qc, t, theta):
             target_qubit = t
             qc.cp(2*pi*theta, control_qubit, target_qubit)
         qc.barrier()
-    # inverse Fourier transform on the first t qubits
-    QFourier_inverse(qc, t)
-    # measure the first t qubits
-    qc.measure(range(t), range(t))
+    if measured_iqft:
+        # measure the first t qubits during their inverse Fourier transform
+        QFourier_inverse_measured(qc, t)
+    else:
+        # inverse Fourier transform on the first t qubits
+        QFourier_inverse(qc, t)
+        # measure the first t qubits
+        qc.measure(range(t), range(t))
 
     return qc
 
@@ -34,19 +44,19 @@ def QuantumPhaseEstimation(qc, t, theta):
 if __name__ == '__main__':
     t = 3
     theta = 1/3
-    # initialization
-    qc = QuantumCircuit(t+1, t)
-    qc.x(t)
-    qc.barrier()
-    # build the circuit for quantum phase estimation
-    QuantumPhaseEstimation(qc, t, theta)
+    with stage('build', t=t, theta=theta) as s:
+        # initialization
+        qc = QuantumCircuit(t+1, t)
+        qc.x(t)
+        qc.barrier()
+        # build the circuit for quantum phase estimation
+        QuantumPhaseEstimation(qc, t, theta)
+        s.record(circuit=qc)
     qc.draw(output='mpl')
     plt.show()
 
-    aer_sim = Aer.get_backend('aer_simulator')
     shots = 2048
-    qobj = assemble(qc, shots=shots)
-    results = aer_sim.run(qobj).result()
+    results = simulate(qc, shots=shots, optimize=True)
     counts = results.get_counts()
     plot_histogram(counts)
     plt.show()
\ No newline at end of file
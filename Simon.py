@@ -1,3 +1,4 @@
+import numpy as np
 # importing Qiskit
 from qiskit import IBMQ, Aer
 from qiskit.providers.ibmq import least_busy
@@ -6,12 +7,19 @@ from qiskit import QuantumCircuit, transpile, assemble
 # import basic plot tools
 from qiskit.visualization import plot_histogram
 import matplotlib.pyplot as plt
+# import the opt-in stage instrumentation
+from Instrumentation import stage, instrumented
+# import the simulator dispatching small circuits to the NumPy statevector engine
+from StatevectorEngine import simulate
+# import the integer array representation of counts
+from MeasurementCounts import result_counts, int_to_bitstring
 
 
 # construct the oracle function for Simon's algorithm
 # currently we only implemented case of: 
 #   (1) 2 qubits and the secret string b='11'
 #   (2) 3 qubits and the secret string b='110'  
+@instrumented
 def Simon_oracle(b):
     b_str=str(b)
     n=len(b_str)
@@ -48,36 +56,47 @@ def bdotz(b, z):
         accum += int(b[i]) * int(z[i])
     return (accum % 2)
 
-    
+
+# Calculate the dot products of b with an array of integer outcomes z at once
+def bdotz_array(b, z):
+    z = np.asarray(z) & int(b, 2)
+    accum = np.zeros(len(z), dtype=np.int64)
+    for i in range(len(b)):
+        accum ^= (z >> i) & 1
+    return accum
+
+
 if __name__=='__main__':
     # Implement the circuit for Simon's algorithm
     b='101'
     n=len(b)
-    Simon_circuit = QuantumCircuit(2*n, n)
-    # Apply Hadamard gates before querying the oracle
-    Simon_circuit.h(range(n))
-    # Apply barrier for visual separation
-    Simon_circuit.barrier()
-    # Apply the Simon oracle
-    Simon_circuit += Simon_oracle(b)
-    # Apply barrier for visual separation
-    Simon_circuit.barrier()
-    # Apply Hadamard gates to the input register
-    Simon_circuit.h(range(n))
-    # Measure qubits
-    Simon_circuit.measure(range(n), range(n))
+    with stage('build', b=b) as s:
+        Simon_circuit = QuantumCircuit(2*n, n)
+        # Apply Hadamard gates before querying the oracle
+        Simon_circuit.h(range(n))
+        # Apply barrier for visual separation
+        Simon_circuit.barrier()
+        # Apply the Simon oracle
+        Simon_circuit += Simon_oracle(b)
+        # Apply barrier for visual separation
+        Simon_circuit.barrier()
+        # Apply Hadamard gates to the input register
+        Simon_circuit.h(range(n))
+        # Measure qubits
+        Simon_circuit.measure(range(n), range(n))
+        s.record(circuit=Simon_circuit)
     Simon_circuit.draw(output='mpl')
     plt.show()
 
     # use local simulator
-    aer_sim = Aer.get_backend('aer_simulator')
     shots = 1024
-    qobj = assemble(Simon_circuit, shots=shots)
-    results = aer_sim.run(qobj).result()
-    counts = results.get_counts()
-    plot_histogram(counts)
+    results = simulate(Simon_circuit, shots=shots)
+    counts = result_counts(results)
+    plot_histogram(counts.to_dict())
     plt.show()
     
     # check b\cdot z=0 for all outputs z
-    for z in counts:
-        print('{}.{} = {} (mod 2)'.format(b, z, bdotz(b,z)) )
+    with stage('postprocess'):
+        dots = bdotz_array(b, counts.outcomes)
+    for z, dot in zip(counts.outcomes, dots):
+        print('{}.{} = {} (mod 2)'.format(b, int_to_bitstring(z, n), dot) )
@@ -0,0 +1,305 @@
+import numpy as np
+from numpy import pi
+# importing Qiskit
+from qiskit import Aer, transpile
+from qiskit.circuit import Gate, Clbit, ClassicalRegister
+from qiskit.quantum_info import Operator
+# import the opt-in stage instrumentation
+from Instrumentation import stage
+# import the integer array representation of counts
+from MeasurementCounts import CountsArray
+# import the barrier stripping and peephole pass
+from CircuitOptimization import performance_compile
+
+
+# A small in-process NumPy statevector simulator for the circuits of this project.
+# The state of n qubits is kept as a tensor of shape (2,)*n, where qubit q is the
+# axis n-1-q (qiskit's little-endian ordering), and gates are applied in place on
+# views of that tensor. Circuits with at most MAX_QUBITS qubits which only use the
+# supported gates are run here, everything else goes to Aer. Gates conditioned (c_if)
+# on the clbits of measured qubits are run as gates controlled by those qubits.
+
+MAX_QUBITS = 16
+# custom gates up to this many qubits are applied as a cached unitary matrix,
+# larger ones are expanded into their definition
+MAX_MATRIX_QUBITS = 6
+
+_SQRT_HALF = 1/np.sqrt(2)
+# instructions without effect on the final state
+_IGNORED = ('barrier', 'save_statevector', 'id')
+# diagonal gates given by the phase on the all ones state of their qubits
+_PHASES = {'z': pi, 'cz': pi, 's': pi/2, 'sdg': -pi/2, 't': pi/4, 'tdg': -pi/4}
+# multi-controlled X gates acting exactly as an X on the target for any state of their
+# ancillas; mcx_vchain assumes clean ancillas, so it is expanded into its definition
+_MCX = ('mcx', 'mcx_gray', 'mcx_recursive')
+# the unitary matrices of custom gates, keyed by id of the gate
+_matrix_cache = {}
+
+
+# the result of a simulation, with the get_counts/get_memory interface of qiskit's Result
+# the outcomes are kept as integer arrays and only formatted as bitstrings on request
+class EngineResult:
+    def __init__(self, counts, memory, statevector, circuit):
+        self.counts = counts
+        self.memory = memory
+        self.statevector = statevector
+        self.register_sizes = [register.size for register in circuit.cregs]
+
+    def get_counts_array(self, experiment=None):
+        return self.counts
+
+    def get_memory_array(self, experiment=None):
+        if self.memory is None:
+            raise ValueError('No memory for this result, simulate with memory=True')
+        return self.memory
+
+    def get_counts(self, experiment=None):
+        return {self._format_outcome(outcome): int(frequency)
+                for outcome, frequency in zip(self.counts.outcomes, self.counts.frequencies)}
+
+    def get_memory(self, experiment=None):
+        return [self._format_outcome(value) for value in self.get_memory_array()]
+
+    def get_statevector(self, experiment=None):
+        return self.statevector
+
+    # the measured outcome as a string of bits, registers separated by spaces as in qiskit
+    def _format_outcome(self, value):
+        bits = format(int(value), '0{}b'.format(self.counts.num_bits))
+        if len(self.register_sizes) < 2:
+            return bits
+        registers, end = [], len(bits)
+        for size in self.register_sizes:
+            registers.append(bits[end-size:end])
+            end -= size
+        return ' '.join(reversed(registers))
+
+
+# the index of the view of state in which the given qubits hold the given bits
+def _index(n, bits):
+    index = [slice(None)]*n
+    for qubit, bit in bits.items():
+        index[n-1-qubit] = slice(bit, bit+1)
+    return tuple(index)
+
+
+# swap the amplitudes of the two subspaces given by bits_0 and bits_1
+def _swap_amplitudes(state, n, bits_0, bits_1):
+    index_0 = _index(n, bits_0)
+    index_1 = _index(n, bits_1)
+    amplitudes = state[index_0].copy()
+    state[index_0] = state[index_1]
+    state[index_1] = amplitudes
+
+
+# multiply the amplitudes where all qubits are one by e^{i phase}
+def _apply_phase(state, n, qubits, phase):
+    state[_index(n, {qubit: 1 for qubit in qubits})] *= np.exp(1j*phase)
+
+
+def _apply_h(state, n, qubit):
+    amplitudes_0 = state[_index(n, {qubit: 0})]
+    amplitudes_1 = state[_index(n, {qubit: 1})]
+    total = amplitudes_0 + amplitudes_1
+    amplitudes_1 -= amplitudes_0
+    amplitudes_1 *= -_SQRT_HALF
+    amplitudes_0[...] = total*_SQRT_HALF
+
+
+# apply a 2^k x 2^k unitary matrix to k qubits through a tensor contraction
+def _apply_matrix(state, n, qubits, matrix):
+    k = len(qubits)
+    tensor = matrix.reshape((2,)*(2*k))
+    # the matrix axes run from qubits[k-1] down to qubits[0]
+    axes = [n-1-qubit for qubit in reversed(qubits)]
+    result = np.tensordot(tensor, state, axes=(list(range(k, 2*k)), axes))
+    state[...] = np.moveaxis(result, list(range(k)), axes)
+
+
+def _gate_matrix(operation):
+    key = id(operation)
+    if key not in _matrix_cache:
+        if len(_matrix_cache) >= 256:
+            _matrix_cache.clear()
+        _matrix_cache[key] = (operation, Operator(operation).data)
+    return _matrix_cache[key][1]
+
+
+# the {qubit: bit} controls equivalent to the condition (c_if) of an operation, by the
+# deferred measurement principle: a clbit holds the value of the qubit last measured into
+# it, and that qubit is never touched again, so conditioning on the clbit is controlling
+# on the qubit; returns None for conditions on clbits not measured yet
+def _condition_controls(condition, clbit_positions, clbit_indices, measured):
+    bits, value = condition
+    if isinstance(bits, Clbit):
+        bits = [bits]
+    elif not isinstance(bits, ClassicalRegister):
+        return None
+    sources = {clbit: qubit for qubit, clbit in measured}
+    controls = {}
+    for position, bit in enumerate(bits):
+        clbit = clbit_indices[clbit_positions[bit]]
+        if clbit not in sources:
+            return None
+        controls[sources[clbit]] = (value >> position) & 1
+    return controls
+
+
+# flatten circuit into the list of (name, operation, qubits, controls) gates run by the
+# engine, where controls {qubit: bit} come from conditions on measured clbits, and the
+# (qubit, clbit) pairs of the measurements, in the order they are measured
+# returns None if the circuit cannot be run by the engine
+def _flatten(circuit, qubit_indices=None, clbit_indices=None, gates=None, measured=None, controls=None):
+    if qubit_indices is None:
+        qubit_indices = list(range(circuit.num_qubits))
+        clbit_indices = list(range(circuit.num_clbits))
+        gates, measured, controls = [], [], {}
+    qubit_positions = {qubit: index for index, qubit in enumerate(circuit.qubits)}
+    clbit_positions = {clbit: index for index, clbit in enumerate(circuit.clbits)}
+    for operation, qargs, cargs in circuit.data:
+        name = operation.name
+        qubits = [qubit_indices[qubit_positions[qubit]] for qubit in qargs]
+        operation_controls = controls
+        condition = getattr(operation, 'condition', None)
+        if condition is not None:
+            condition_controls = _condition_controls(condition, clbit_positions, clbit_indices, measured)
+            if condition_controls is None or name == 'measure':
+                return None
+            operation_controls = {**controls, **condition_controls}
+        if name in _IGNORED:
+            continue
+        if name == 'measure':
+            if controls:
+                return None
+            measured.append((qubits[0], clbit_indices[clbit_positions[cargs[0]]]))
+            continue
+        # only measurements at the end of the circuit are supported
+        if any(qubit in qubits for qubit, _ in measured) or name == 'reset':
+            return None
+        if name in ('h', 'x', 'cx', 'ccx', 'swap', 'cswap', 'p', 'cp', 'mcphase') or name in _PHASES:
+            gates.append((name, operation, qubits, operation_controls))
+        elif name in _MCX:
+            # the controls, then the target, the ancillas of mcx_recursive are left unchanged
+            gates.append(('mcx', operation, qubits[:operation.num_ctrl_qubits+1], operation_controls))
+        elif isinstance(operation, Gate) and len(qubits) <= MAX_MATRIX_QUBITS and operation.definition is not None:
+            gates.append(('unitary', operation, qubits, operation_controls))
+        elif operation.definition is not None:
+            # larger gates and other instructions (initialize, reset) are expanded
+            clbits = [clbit_indices[clbit_positions[clbit]] for clbit in cargs]
+            if _flatten(operation.definition, qubits, clbits, gates, measured, operation_controls) is None:
+                return None
+        else:
+            return None
+    return gates, measured
+
+
+# run the flattened gates on |0...0> of n qubits, returns the state tensor
+def _evolve(gates, n):
+    state = np.zeros((2,)*n, dtype=complex)
+    state[(0,)*n] = 1
+    for name, operation, qubits, controls in gates:
+        # a conditioned gate acts on the view where its control qubits hold their bits
+        if controls:
+            view = state[_index(n, controls)]
+        else:
+            view = state
+        if name == 'h':
+            _apply_h(view, n, qubits[0])
+        elif name in ('x', 'cx', 'ccx', 'mcx'):
+            gate_controls = {qubit: 1 for qubit in qubits[:-1]}
+            _swap_amplitudes(view, n, {**gate_controls, qubits[-1]: 0}, {**gate_controls, qubits[-1]: 1})
+        elif name in ('swap', 'cswap'):
+            gate_controls = {qubit: 1 for qubit in qubits[:-2]}
+            a, b = qubits[-2:]
+            _swap_amplitudes(view, n, {**gate_controls, a: 0, b: 1}, {**gate_controls, a: 1, b: 0})
+        elif name in _PHASES:
+            _apply_phase(view, n, qubits, _PHASES[name])
+        elif name in ('p', 'cp', 'mcphase'):
+            _apply_phase(view, n, qubits, float(operation.params[0]))
+        else:
+            _apply_matrix(view, n, qubits, _gate_matrix(operation))
+    return state
+
+
+# check whether circuit can be run by the engine
+def engine_supports(circuit):
+    return circuit.num_qubits <= MAX_QUBITS and _flatten(circuit) is not None
+
+
+# the final statevector of circuit (ignoring measurements) as a flat array
+def engine_statevector(circuit):
+    flattened = _flatten(circuit)
+    if flattened is None:
+        raise ValueError('Circuit uses instructions the statevector engine does not support')
+    return _evolve(flattened[0], circuit.num_qubits).reshape(-1)
+
+
+# simulate circuit with the NumPy engine, sampling the measured clbits shots times
+def engine_run(circuit, shots=1024, memory=False, seed=None, flattened=None):
+    flattened = flattened or _flatten(circuit)
+    if flattened is None:
+        raise ValueError('Circuit uses instructions the statevector engine does not support')
+    gates, measured = flattened
+    statevector = _evolve(gates, circuit.num_qubits).reshape(-1)
+    num_clbits = circuit.num_clbits
+    if not measured:
+        samples = np.zeros(shots, dtype=np.int64)
+        return EngineResult(CountsArray.from_samples(samples, num_clbits), samples if memory else None,
+                            statevector, circuit)
+    # the value of the classical register for every basis state, a clbit measured
+    # more than once holds its last measurement
+    basis_states = np.arange(len(statevector))
+    values = np.zeros(len(statevector), dtype=np.int64)
+    for clbit, qubit in {clbit: qubit for qubit, clbit in measured}.items():
+        values |= ((basis_states >> qubit) & 1) << clbit
+    probabilities = np.bincount(values, weights=np.abs(statevector)**2, minlength=2**num_clbits)
+    probabilities /= probabilities.sum()
+    rng = np.random.default_rng(seed)
+    if memory:
+        samples = rng.choice(len(probabilities), size=shots, p=probabilities)
+        counts = CountsArray.from_samples(samples, num_clbits)
+    else:
+        samples = None
+        counts = CountsArray.from_dense(rng.multinomial(shots, probabilities), num_clbits)
+    return EngineResult(counts, samples, statevector, circuit)
+
+
+# simulate circuit, on the NumPy engine if it is small enough and supported, otherwise on Aer
+# returns a result with get_counts() and get_memory() as from backend.run(...).result()
+# optimize=True runs the performance compile mode of CircuitOptimization first
+# transpiled=True takes circuit as already transpiled for backend and runs it on Aer as is
+def simulate(circuit, shots=1024, memory=False, seed=None, backend=None, optimize=False, transpiled=False):
+    if optimize:
+        with stage('optimize') as s:
+            circuit = performance_compile(circuit)
+            s.record(circuit=circuit)
+    flattened = _flatten(circuit) if backend is None and not transpiled and circuit.num_qubits <= MAX_QUBITS else None
+    if flattened is not None:
+        with stage('simulate', engine='numpy') as s:
+            result = engine_run(circuit, shots, memory, seed, flattened)
+            s.record(shots=shots)
+        return result
+    backend = backend or Aer.get_backend('aer_simulator')
+    if transpiled:
+        transpiled_circuit = circuit
+    else:
+        with stage('transpile') as s:
+            transpiled_circuit = transpile(circuit, backend)
+            s.record(circuit=transpiled_circuit, backend=backend)
+    with stage('simulate') as s:
+        result = backend.run(transpiled_circuit, shots=shots, memory=memory, seed_simulator=seed).result()
+        s.record(shots=shots, backend=backend)
+    return result
+
+
+# the final statevector of circuit, on the NumPy engine if possible, otherwise on Aer
+def simulate_statevector(circuit, optimize=False):
+    if optimize:
+        circuit = performance_compile(circuit)
+    if engine_supports(circuit):
+        return engine_statevector(circuit)
+    backend = Aer.get_backend('aer_simulator')
+    qc = circuit.copy()
+    if 'save_statevector' not in qc.count_ops():
+        qc.save_statevector()
+    return np.asarray(backend.run(transpile(qc, backend)).result().get_statevector())